@@ -0,0 +1,600 @@
+# core.py - Shared MediaPipe video analysis and leukocoria detection
+import os
+import cv2
+import math
+import numpy as np
+import mediapipe as mp
+import queue
+import shutil
+import subprocess
+import tempfile
+import threading
+import logging
+
+try:
+    from numba import njit
+except ImportError:  # numba is optional - the kernels still run as plain Python
+    def njit(*args, **kwargs):
+        return lambda fn: fn
+
+# ================= CONFIGURATION FROM YOUR SOURCE =================
+MOVE_PX_MIN = 30            # eye must move ≥ this to call it "tracking"
+RATIO_THRESH = 0.30         # lazy‑eye ratio threshold (≤ → flag)
+HIST_FRAMES = 60            # frames stored per sweep
+MIN_HIST_FRAMES = 15        # samples needed before a sweep is evaluated
+FRAME_STRIDE = 2            # run MediaPipe on every Nth decoded frame
+PREFETCH_FRAMES = 8         # decoded frames buffered ahead of MediaPipe
+PROCESS_WIDTH = 640         # wider frames are downscaled before MediaPipe
+HIGH_RISK_DETECTIONS = 3    # detections for HIGH risk; analysis stops there
+CAR_SPEED = 7               # stimulus car speed, pixels per frame from your code
+CAR_WIDTH = 100             # stimulus car width in pixels
+
+def _ffmpeg_passthrough_args(ffmpeg_bin):
+    """
+    Output options that keep one frame per decoded frame: -fps_mode on
+    ffmpeg >= 5.1, -vsync on older builds. None if ffmpeg can't be run.
+    """
+    try:
+        help_text = subprocess.run(
+            [ffmpeg_bin, "-hide_banner", "-h", "full"],
+            stdin=subprocess.DEVNULL, capture_output=True, timeout=10
+        ).stdout
+    except (OSError, subprocess.SubprocessError):
+        return None
+    return ["-fps_mode" if b"-fps_mode" in help_text else "-vsync", "passthrough"]
+
+FFMPEG_BIN = shutil.which(os.environ.get('FFMPEG_BIN', 'ffmpeg'))  # None → decode with OpenCV
+FFMPEG_PASSTHROUGH = _ffmpeg_passthrough_args(FFMPEG_BIN) if FFMPEG_BIN else None
+if FFMPEG_PASSTHROUGH is None:
+    FFMPEG_BIN = None
+
+# Parallelism comes from the analysis process pool; OpenCV's own thread
+# pool in every worker would only oversubscribe the cores
+cv2.setNumThreads(1)
+
+# --- Haar cascades for leukocoria detection ---
+FACE_CASCADE = cv2.CascadeClassifier(
+    cv2.data.haarcascades + "haarcascade_frontalface_default.xml"
+)
+EYE_CASCADE = cv2.CascadeClassifier(
+    cv2.data.haarcascades + "haarcascade_eye.xml"
+)
+CASCADE_LOCK = threading.Lock()  # detectMultiScale mutates the shared classifiers
+
+# --- Optional YuNet DNN face detector, replaces both cascades when present ---
+FACE_DETECTOR_MODEL = os.environ.get(
+    'FACE_DETECTOR_MODEL',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'models', 'face_detection_yunet_2023mar.onnx')
+)
+FACE_DETECTOR = (
+    cv2.FaceDetectorYN.create(FACE_DETECTOR_MODEL, "", (320, 320))
+    if os.path.isfile(FACE_DETECTOR_MODEL) else None
+)
+FACE_DETECTOR_LOCK = threading.Lock()  # setInputSize/detect mutate the detector
+EYE_CROP_HALF = 0.15        # eye crop half-size as a fraction of face width
+
+# --- MediaPipe FaceMesh, built once per process and reused ---
+LEFT_IRIS, RIGHT_IRIS = 468, 473
+FACE_MESH = None
+FACE_MESH_LOCK = threading.Lock()  # FaceMesh is not thread-safe
+# Graph file FaceMesh loads, relative to the directory holding the mediapipe package
+FACE_MESH_GRAPH = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(mp.__file__))),
+    'mediapipe', 'modules', 'face_landmark', 'face_landmark_front_cpu.binarypb'
+)
+
+def get_face_mesh():
+    """
+    Returns this process's FaceMesh, building it on first use
+    """
+    global FACE_MESH
+    with FACE_MESH_LOCK:
+        if FACE_MESH is None:
+            FACE_MESH = mp.solutions.face_mesh.FaceMesh(
+                refine_landmarks=True,
+                max_num_faces=1,
+                min_detection_confidence=0.5,
+                min_tracking_confidence=0.5
+            )
+        return FACE_MESH
+
+logger = logging.getLogger(__name__)
+
+class AnalysisError(Exception):
+    """
+    Raised by analyze_video when a video cannot be analysed
+    """
+
+def init_worker(log_level=logging.INFO):
+    """
+    Process-pool initializer: sets up logging and warms the FaceMesh
+    graph before the first video arrives
+    """
+    logging.basicConfig(level=log_level)
+    get_face_mesh()
+
+def check_face_mesh():
+    """
+    /test probe: True if MediaPipe's FaceMesh graph is installed. A file
+    check, so it neither builds a graph in the web process nor waits
+    behind analyses in the pool
+    """
+    return os.path.isfile(FACE_MESH_GRAPH)
+
+# ================= YOUR ORIGINAL ALGORITHM =================
+def detect_lazy_eye(hist_buf, first, last, move_min, ratio=RATIO_THRESH):
+    """
+    Your original lazy eye detection algorithm, applied to the first and
+    last rows of a sweep's (left_x, left_y, right_x, right_y) history.
+    move_min uses the same units as the positions.
+    """
+    return lazy_eye_kernel(hist_buf, first, last, move_min, ratio)
+
+@njit(cache=True, fastmath=True)
+def lazy_eye_kernel(hist_buf, first, last, move_min, ratio):
+    """
+    Compiled core of detect_lazy_eye: returns (is_lazy, disp_l, disp_r)
+    """
+    disp_l = math.hypot(hist_buf[last, 0] - hist_buf[first, 0],
+                        hist_buf[last, 1] - hist_buf[first, 1])
+    disp_r = math.hypot(hist_buf[last, 2] - hist_buf[first, 2],
+                        hist_buf[last, 3] - hist_buf[first, 3])
+    fast, slow = max(disp_l, disp_r), min(disp_l, disp_r)
+
+    is_lazy = fast > move_min and slow < fast * ratio
+    return is_lazy, disp_l, disp_r
+
+# Compile (or load from cache) at import so the first video doesn't pay for it
+lazy_eye_kernel(np.zeros((2, 4)), 0, 1, 1.0, RATIO_THRESH)
+
+_END_OF_STREAM = object()
+# RGB buffers a reader cycles through: PREFETCH_FRAMES queued, one in
+# MediaPipe and one being written, so a buffer is never reused in flight
+_RGB_BUFFERS = PREFETCH_FRAMES + 2
+
+def _frame_plan(w):
+    """
+    Replays the bouncing-car stimulus for a frame width and yields
+    (needed, is_bounce) for each source frame. A sweep only keeps the last
+    HIST_FRAMES samples before its bounce, so earlier frames can never
+    reach detect_lazy_eye and are marked as not needed.
+    """
+    window = HIST_FRAMES * FRAME_STRIDE
+    car_x, car_speed = 0, CAR_SPEED
+    start = bounce = 0
+    while True:
+        # Advance to the next bounce (your original bounce logic)
+        while True:
+            car_x += car_speed
+            if car_x + CAR_WIDTH > w or car_x < 0:
+                car_speed = -car_speed
+                car_x = max(0, min(car_x, w - CAR_WIDTH))
+                break
+            bounce += 1
+        for frame_idx in range(start, bounce + 1):
+            yield (frame_idx % FRAME_STRIDE == 0 and bounce - frame_idx < window,
+                   frame_idx == bounce)
+        start = bounce = bounce + 1
+
+def _queue_put(frames_q, item, stop):
+    """
+    Blocking put that gives up once the consumer has stopped
+    """
+    while not stop.is_set():
+        try:
+            frames_q.put(item, timeout=0.1)
+            return
+        except queue.Full:
+            pass
+
+def _read_frames(cap, src_w, src_h, frames_q, stop):
+    """
+    Reader thread: decodes the video and queues one (rgb, w, h, is_bounce)
+    item per source frame. rgb is None for frames MediaPipe does not need
+    to see; w/h are the source dimensions and the RGB image may be
+    downscaled.
+    """
+    try:
+        # Reused across frames; OpenCV reallocates a dst only if its shape changes
+        frame = small = None
+        rgb_bufs = [None] * _RGB_BUFFERS
+        slot = 0
+        skipped = ((None, src_w, src_h, False), (None, src_w, src_h, True))
+        plan = _frame_plan(src_w)
+        # grab() advances the stream without the BGR conversion/copy;
+        # only frames that are needed pay for retrieve()
+        while not stop.is_set() and cap.grab():
+            needed, is_bounce = next(plan)
+            item = skipped[is_bounce]
+            if needed:
+                ret, frame = cap.retrieve(frame)
+                if not ret:
+                    break
+                h, w = frame.shape[:2]
+                src = frame
+                if w > PROCESS_WIDTH:
+                    small = src = cv2.resize(
+                        frame, (PROCESS_WIDTH, int(h * PROCESS_WIDTH / w)),
+                        dst=small, interpolation=cv2.INTER_AREA
+                    )
+                # MediaPipe only takes C-contiguous SRGB, so a frame[..., ::-1]
+                # view would just be copied on the inference thread instead;
+                # swapping here, after the downscale, into a reused buffer
+                # keeps that copy small and overlapped with inference
+                rgb_bufs[slot] = cv2.cvtColor(src, cv2.COLOR_BGR2RGB, dst=rgb_bufs[slot])
+                item = (rgb_bufs[slot], w, h, is_bounce)
+                slot = (slot + 1) % _RGB_BUFFERS
+            _queue_put(frames_q, item, stop)
+    except Exception as e:
+        _queue_put(frames_q, e, stop)
+    finally:
+        _queue_put(frames_q, _END_OF_STREAM, stop)
+
+def _read_frames_ffmpeg(video_path, src_w, src_h, frames_q, stop):
+    """
+    Reader thread fast path: ffmpeg decodes, drops frames off the
+    FRAME_STRIDE grid, downscales and converts to RGB in one pass and
+    pipes raw frames to us. Queues the same items as _read_frames (minus
+    any frames after the last piped one).
+    """
+    out_w = min(src_w, PROCESS_WIDTH)
+    out_h = int(src_h * out_w / src_w)
+    frame_bytes = out_w * out_h * 3
+    vf = f"scale={out_w}:{out_h}:flags=area"
+    if FRAME_STRIDE > 1:
+        # MediaPipe never sees off-stride frames, so don't scale or pipe them
+        vf = f"select=not(mod(n\\,{FRAME_STRIDE})),{vf}"
+    cmd = [
+        FFMPEG_BIN, "-nostdin", "-v", "error",
+        "-hwaccel", "auto", "-threads", "2", "-i", video_path,
+        "-vf", vf,
+        # one output frame per decoded frame: rawvideo would otherwise be
+        # resampled to a constant rate (dropping/duplicating frames of
+        # variable-rate MediaRecorder WebMs) and drift from the frame plan
+        *FFMPEG_PASSTHROUGH,
+        "-pix_fmt", "rgb24", "-f", "rawvideo", "pipe:1"
+    ]
+    proc = None
+    try:
+        with tempfile.TemporaryFile() as errlog:
+            proc = subprocess.Popen(
+                cmd, stdout=subprocess.PIPE, stderr=errlog, bufsize=1 << 20
+            )
+            # Frames are read straight into a fixed set of buffers; skipped
+            # frames land in the current slot, which is simply reused
+            rgb_bufs = [np.empty(frame_bytes, np.uint8) for _ in range(_RGB_BUFFERS)]
+            slot = 0
+            skipped = ((None, src_w, src_h, False), (None, src_w, src_h, True))
+            plan = _frame_plan(src_w)
+            gap = 0  # off-stride source frames between two piped frames
+            while not stop.is_set():
+                if proc.stdout.readinto(rgb_bufs[slot]) < frame_bytes:
+                    break
+                for _ in range(gap):
+                    _queue_put(frames_q, skipped[next(plan)[1]], stop)
+                gap = FRAME_STRIDE - 1
+                needed, is_bounce = next(plan)
+                item = skipped[is_bounce]
+                if needed:
+                    item = (rgb_bufs[slot].reshape(out_h, out_w, 3), src_w, src_h, is_bounce)
+                    slot = (slot + 1) % _RGB_BUFFERS
+                _queue_put(frames_q, item, stop)
+
+            if not stop.is_set() and proc.wait() != 0:
+                errlog.seek(0)
+                raise Exception(f"ffmpeg failed: {errlog.read().decode(errors='replace').strip()}")
+    except Exception as e:
+        _queue_put(frames_q, e, stop)
+    finally:
+        if proc is not None:
+            proc.kill()
+            proc.stdout.close()
+            proc.wait()
+        _queue_put(frames_q, _END_OF_STREAM, stop)
+
+_decode_path_logged = False
+
+def _log_decode_path(cap):
+    """
+    Logs once per process which decoder produces the frames: the ffmpeg
+    pipe, or the OpenCV backend along with its hardware acceleration status
+    """
+    global _decode_path_logged
+    if _decode_path_logged:
+        return
+    _decode_path_logged = True
+    if FFMPEG_BIN:
+        logger.info(f"🎞️ Video decode: ffmpeg pipe ({FFMPEG_BIN}, -hwaccel auto)")
+        return
+    try:
+        backend = cap.getBackendName()
+    except cv2.error:
+        backend = "unknown"
+    hw_accel = int(cap.get(cv2.CAP_PROP_HW_ACCELERATION))
+    logger.info(f"🎞️ Video decode: OpenCV {backend} backend (hw acceleration: "
+                f"{'on' if hw_accel != cv2.VIDEO_ACCELERATION_NONE else 'off'})")
+
+def _open_capture(video_path, hw_accel=True):
+    """
+    Opens the video on OpenCV's FFmpeg backend, with hardware decoding
+    (VAAPI/NVDEC/...) where the host has it unless hw_accel is False;
+    falls back to the default backend if that fails
+    """
+    try:
+        params = [cv2.CAP_PROP_HW_ACCELERATION, cv2.VIDEO_ACCELERATION_ANY] if hw_accel else []
+        cap = cv2.VideoCapture(video_path, cv2.CAP_FFMPEG, params)
+        if cap.isOpened():
+            return cap
+        cap.release()
+    except cv2.error as e:
+        logger.warning(f"FFmpeg capture failed, using default backend: {e}")
+    return cv2.VideoCapture(video_path)
+
+def analyze_video(video_path):
+    """
+    Real video analysis using your MediaPipe algorithm.
+    Raises AnalysisError if the video cannot be analysed.
+    """
+    try:
+        logger.info(f"📹 Starting MediaPipe analysis on: {video_path}")
+        
+        # MediaPipe setup (same as your code, reused across videos)
+        mesh = get_face_mesh()
+
+        # Open video; with the ffmpeg reader OpenCV only reads metadata,
+        # so skip setting up a hardware decoder it would never use
+        cap = _open_capture(video_path, hw_accel=not FFMPEG_BIN)
+        if not cap.isOpened():
+            raise AnalysisError("Could not open video file")
+        
+        # Get video properties
+        fps = cap.get(cv2.CAP_PROP_FPS) or 30.0
+        frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        duration = frame_count / fps if fps > 0 else 0
+        width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+        height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+        
+        logger.info(f"📊 Video: {duration:.1f}s, {frame_count} frames, {fps:.1f}fps, {width}x{height}")
+        if width <= 0 or height <= 0:
+            raise AnalysisError("Could not read video dimensions")
+        
+        # Analysis variables (same as your code)
+        # Ring buffer of (left_x, left_y, right_x, right_y) for the current sweep
+        hist_buf = np.empty((HIST_FRAMES, 4), dtype=np.float64)
+        hist_head = 0  # next slot to write
+        hist_len = 0
+        aspect = move_norm = None  # set from the first frame MediaPipe sees
+        frames_analyzed = 0
+        frames_sampled = 0
+        frames_with_face = 0
+        lazy_eye_detections = 0
+        early_exit = False
+        raw_events = []  # (timestamp, disp_l, disp_r, bounce); formatted after the loop
+        
+        # The car stimulus is replayed by the reader (_frame_plan), which
+        # flags bounce frames and only decodes frames a sweep can use
+        bounce_count = 0
+        
+        # Decode on a reader thread so it overlaps with MediaPipe inference;
+        # FaceMesh itself is not thread-safe and stays on this thread
+        frames_q = queue.Queue(maxsize=PREFETCH_FRAMES)
+        stop = threading.Event()
+        _log_decode_path(cap)
+        if FFMPEG_BIN:
+            cap.release()
+            target, args = _read_frames_ffmpeg, (video_path, width, height, frames_q, stop)
+        else:
+            target, args = _read_frames, (cap, width, height, frames_q, stop)
+        reader = threading.Thread(target=target, args=args, daemon=True)
+        reader.start()
+
+        FACE_MESH_LOCK.acquire()
+        try:
+            while True:
+                item = frames_q.get()
+                if item is _END_OF_STREAM:
+                    break
+                if isinstance(item, Exception):
+                    raise item
+
+                frames_analyzed += 1
+                rgb, w, h, is_bounce = item
+
+                if rgb is not None:
+                    frames_sampled += 1
+                    if move_norm is None:
+                        # Iris positions stay in MediaPipe's normalised space,
+                        # with y rescaled so both axes are in frame widths
+                        aspect = h / w
+                        move_norm = MOVE_PX_MIN / w
+
+                    # MediaPipe processing (exactly like your code)
+                    results = mesh.process(rgb)
+
+                    if results.multi_face_landmarks:
+                        frames_with_face += 1
+
+                        # Extract iris positions (same as your code)
+                        pts = results.multi_face_landmarks[0].landmark
+                        li = pts[LEFT_IRIS]
+                        ri = pts[RIGHT_IRIS]
+                        hist_buf[hist_head] = (li.x, li.y * aspect, ri.x, ri.y * aspect)
+                        hist_head = (hist_head + 1) % HIST_FRAMES
+                        hist_len = min(hist_len + 1, HIST_FRAMES)
+
+                if is_bounce:
+                    # Bounce detected - evaluate lazy eye (your original logic)
+                    bounce_count += 1
+
+                    # Apply your detection algorithm to the oldest/newest samples
+                    if hist_len >= MIN_HIST_FRAMES:
+                        first = (hist_head - hist_len) % HIST_FRAMES
+                        last = (hist_head - 1) % HIST_FRAMES
+                        is_lazy, disp_l, disp_r = detect_lazy_eye(
+                            hist_buf, first, last, move_norm
+                        )
+                    else:
+                        is_lazy, disp_l, disp_r = False, 0.0, 0.0
+
+                    if is_lazy:
+                        lazy_eye_detections += 1
+                        timestamp = frames_analyzed / fps
+                        disp_l *= w
+                        disp_r *= w
+
+                        raw_events.append((timestamp, disp_l, disp_r, bounce_count))
+
+                        if logger.isEnabledFor(logging.INFO):
+                            logger.info(f"⚠️ Lazy eye detected at {timestamp:.1f}s - L:{disp_l:.1f}px, R:{disp_r:.1f}px")
+
+                        if lazy_eye_detections >= HIGH_RISK_DETECTIONS:
+                            # Risk level cannot rise any further
+                            logger.info("⏹️ Early exit: HIGH risk confirmed")
+                            early_exit = True
+                            break
+
+                    # Clear history after evaluation (your original logic);
+                    # the next sweep simply starts at the current head slot
+                    hist_len = 0
+        finally:
+            FACE_MESH_LOCK.release()
+            stop.set()
+            reader.join()
+
+        # Cleanup
+        cap.release()
+        
+        # Calculate results
+        detection_events = [
+            {
+                "timestamp": round(timestamp, 1),
+                "left_displacement": round(disp_l, 1),
+                "right_displacement": round(disp_r, 1),
+                "message": f"Lazy eye detected at bounce #{bounce}",
+                "bounce_number": bounce
+            }
+            for timestamp, disp_l, disp_r, bounce in raw_events
+        ]
+        face_detection_rate = (frames_with_face / frames_sampled * 100) if frames_sampled > 0 else 0
+        
+        # Risk assessment based on your algorithm results
+        if lazy_eye_detections >= HIGH_RISK_DETECTIONS:
+            risk_level = "HIGH"
+            confidence = "High"
+            recommendation = "Multiple detections found. Consult an eye care professional immediately."
+        elif lazy_eye_detections >= 1:
+            risk_level = "MEDIUM"
+            confidence = "Medium"
+            recommendation = "Asymmetric eye movement detected. Consider professional evaluation."
+        else:
+            risk_level = "LOW"
+            confidence = "High" if face_detection_rate > 70 else "Medium"
+            recommendation = "No significant asymmetric eye movements detected."
+        
+        results = {
+            "video_info": {
+                "duration": round(duration, 1),
+                "fps": round(fps, 1),
+                "total_frames": frame_count,
+                "resolution": f"{width}x{height}",
+                "bounces_analyzed": bounce_count
+            },
+            "analysis": {
+                "frames_analyzed": frames_analyzed,
+                "frames_sampled": frames_sampled,
+                "frames_with_face": frames_with_face,
+                "face_detection_rate": round(face_detection_rate, 1),
+                "lazy_eye_detections": lazy_eye_detections,
+                "detection_events": detection_events,
+                "early_exit": early_exit,
+                "algorithm": "mediapipe_with_bounce_detection"
+            },
+            "risk_assessment": {
+                "level": risk_level,
+                "confidence": confidence,
+                "recommendation": recommendation
+            }
+        }
+        
+        logger.info(f"✅ Analysis complete: {lazy_eye_detections} detections in {bounce_count} bounces")
+        return results
+        
+    except Exception as e:
+        logger.error(f"❌ Analysis error: {str(e)}")
+        raise AnalysisError(f"MediaPipe analysis failed: {str(e)}") from e
+
+# ================= LEUKOCORIA DETECTION =================
+def _eye_has_reflex(eye: np.ndarray) -> bool:
+    """
+    Pupil check for a single eye crop: True for a white/yellow reflex.
+    """
+    gray_eye = cv2.cvtColor(eye, cv2.COLOR_BGR2GRAY)
+    _, thresh = cv2.threshold(
+        cv2.GaussianBlur(gray_eye, (5, 5), 0), 50, 255, cv2.THRESH_BINARY_INV
+    )
+    cnts, _ = cv2.findContours(
+        thresh, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE
+    )
+    if not cnts:
+        return False
+
+    pupil = max(cnts, key=cv2.contourArea)
+    mask = np.zeros(eye.shape[:2], dtype="uint8")
+    cv2.drawContours(mask, [pupil], -1, 255, -1)
+
+    mean_bgr = cv2.mean(eye, mask=mask)[:3]
+    h, s, v = cv2.cvtColor(
+        np.uint8([[mean_bgr]]), cv2.COLOR_BGR2HSV
+    )[0][0]
+
+    return s < 50 and v > 120          # white/yellow reflex
+
+def _yunet_eye_crops(img: np.ndarray):
+    """
+    Yields square eye crops centred on YuNet's eye landmarks, so no
+    separate eye search is needed.
+    """
+    img_h, img_w = img.shape[:2]
+    with FACE_DETECTOR_LOCK:
+        FACE_DETECTOR.setInputSize((img_w, img_h))
+        _, faces = FACE_DETECTOR.detect(img)
+    if faces is None:
+        return
+
+    # Each row: x, y, w, h, right eye (x, y), left eye (x, y), ..., score
+    for face in faces:
+        half = max(int(face[2] * EYE_CROP_HALF), 4)
+        for cx, cy in ((face[4], face[5]), (face[6], face[7])):
+            cx, cy = int(cx), int(cy)
+            eye = img[max(cy - half, 0) : cy + half, max(cx - half, 0) : cx + half]
+            if eye.size:
+                yield eye
+
+def detect_leukocoria(img: np.ndarray) -> bool:
+    """
+    Returns True if *any* eye in the image shows a white/yellow reflex,
+    otherwise False.
+    """
+    if FACE_DETECTOR is not None:
+        return any(_eye_has_reflex(eye) for eye in _yunet_eye_crops(img))
+
+    # Full-frame conversion and face search run on a UMat so OpenCV can
+    # dispatch them to OpenCL when available (plain CPU otherwise). The
+    # per-eye steps work on small ROIs and stay on NumPy arrays.
+    u_gray = cv2.cvtColor(cv2.UMat(img), cv2.COLOR_BGR2GRAY)
+    with CASCADE_LOCK:
+        faces = FACE_CASCADE.detectMultiScale(u_gray, 1.3, 5)
+    if len(faces) == 0:
+        return False
+    gray = u_gray.get()
+
+    for (x, y, w, h) in faces:
+        roi_gray  = gray[y : y + h, x : x + w]
+        roi_color = img[y : y + h, x : x + w]
+
+        with CASCADE_LOCK:
+            eyes = EYE_CASCADE.detectMultiScale(roi_gray)
+        for (ex, ey, ew, eh) in eyes:
+            if _eye_has_reflex(roi_color[ey : ey + eh, ex : ex + ew]):
+                return True
+    return False
@@ -2,15 +2,19 @@
 Gunicorn Configuration for Eye Tracker API
 """
 import multiprocessing
+import os
+import sys
 
 # Server socket
 bind = "0.0.0.0:5000"
 backlog = 2048
 
 # Worker processes
-workers = min(4, multiprocessing.cpu_count() * 2 + 1)
-worker_class = "sync"
-worker_connections = 1000
+# gthread: slow uploads only tie up a thread; the CPU-heavy analysis runs
+# in each worker's process pool, so cores are split between the workers
+workers = min(2, multiprocessing.cpu_count())
+worker_class = "gthread"
+threads = 8
 timeout = 300  # 5 minutes for video processing
 keepalive = 5
 
@@ -21,13 +25,16 @@ max_requests_jitter = 50
 # Logging
 accesslog = "-"
 errorlog = "-"
-loglevel = "info"
+loglevel = os.environ.get('LOG_LEVEL', 'info').lower()
 access_log_format = '%(h)s "%(r)s" %(s)s %(b)s %(D)s μs'
 
 # Process naming
 proc_name = 'eye_tracker_api'
 
 # Server mechanics
+# Preloading shares the imported libraries between workers. MediaPipe's
+# TFLite graph and the analysis pool are built lazily (the pool with
+# spawn), so the master never holds them; post_fork checks that it didn't.
 preload_app = True
 daemon = False
 pidfile = '/tmp/gunicorn_eye_tracker.pid'
@@ -36,3 +43,21 @@ pidfile = '/tmp/gunicorn_eye_tracker.pid'
 raw_env = [
     'FLASK_ENV=production',
 ]
+
+# Analysis process pool size per worker: split the cores between the
+# workers above (start scripts must not override --workers)
+os.environ.setdefault('ANALYSIS_WORKERS', str(max(1, multiprocessing.cpu_count() // workers)))
+
+def post_fork(server, worker):
+    """
+    TFLite interpreters and process pools don't survive fork(), so the
+    master must never build them; warn if preloading ever did
+    """
+    core = sys.modules.get('core')
+    if core is not None and core.FACE_MESH is not None:
+        server.log.warning("FaceMesh was built in the master before fork; "
+                           "MediaPipe in this worker may deadlock")
+    app_module = sys.modules.get('app')
+    if app_module is not None and app_module._executor is not None:
+        server.log.warning("Analysis pool was created in the master before fork; "
+                           "this worker shares its forked copy")
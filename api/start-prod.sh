@@ -1,3 +1,3 @@
 #!/bin/bash
 echo "🚀 Starting with Gunicorn..."
-gunicorn --bind 0.0.0.0:5000 --workers 4 --timeout 300 wsgi:app
+gunicorn --config gunicorn.conf.py wsgi:app